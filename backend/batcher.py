@@ -0,0 +1,111 @@
+"""
+Async micro-batcher.
+Coalesces concurrent single-item requests into one batched call.
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncBatcher:
+    """Collects items submitted within a short window and processes them together."""
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_latency_ms: float = 8.0,
+    ):
+        """
+        Initialize batcher.
+
+        Args:
+            process_batch: Blocking function mapping a list of items to a list of results
+                (run in the default executor)
+            max_batch_size: Maximum number of items per batch
+            max_latency_ms: Maximum time to wait for a batch to fill, in milliseconds
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._batch: List[Tuple[Any, asyncio.Future]] = []
+        self._closed = False
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Submit an item and wait for its result.
+
+        Args:
+            item: Item to process
+
+        Returns:
+            Result for this item
+
+        Raises:
+            RuntimeError: If the batcher has been closed
+        """
+        if self._closed:
+            raise RuntimeError("Batcher is closed")
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def close(self):
+        """Stop the background worker and fail every request still pending."""
+        self._closed = True
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        # Fail the interrupted batch and anything still queued
+        pending, self._batch = self._batch, []
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher is closed"))
+
+    async def _run(self):
+        """Drain the queue in batches until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            # Kept on self so close() can fail a batch interrupted mid-flight
+            self._batch = batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self.process_batch, items)
+            except Exception as e:
+                logger.error(f"Batch of {len(items)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                self._batch = []
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+            self._batch = []
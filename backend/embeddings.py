@@ -1,49 +1,341 @@
 """
 Embedding service using Sentence Transformers.
 Generates vector embeddings for text.
+
+On CPU hosts the default backend runs an INT8-quantized ONNX export of the
+model through ONNX Runtime; CUDA hosts use the PyTorch ("torch") backend.
 """
 
-from sentence_transformers import SentenceTransformer
+import functools
+import json
 import logging
-from typing import List
+import shutil
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from batcher import AsyncBatcher
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "endee"
+QUANTIZED_MODEL_FILE = "model_quantized.onnx"
+SBERT_CONFIG_FILE = "sentence_bert_config.json"
+DEFAULT_MAX_SEQ_LENGTH = 256  # SentenceTransformer default for all-MiniLM-L6-v2
+ENCODE_BATCH_SIZE = 32
+CUDA_ENCODE_BATCH_SIZE = 64
+TOKENIZER_CACHE_SIZE = 4096
+INT8_SCALE = 1.0 / 127.0
+
+
+def _cuda_available() -> bool:
+    """Return True if PyTorch is installed and can see a CUDA device."""
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+def _cpu_supports_bf16() -> bool:
+    """Return True if this CPU has native AVX512-BF16 support."""
+    import torch
+
+    probe = getattr(torch.cpu, "_is_avx512_bf16_supported", None)
+    return bool(probe is not None and probe())
+
 
 class EmbeddingService:
     """Service for generating text embeddings."""
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        model_name: str = "all-MiniLM-L6-v2",
+        backend: str = "auto",
+        cache_dir: Optional[Path] = None,
+        max_batch_size: int = 32,
+        max_latency_ms: float = 8.0,
+    ):
         """
         Initialize embedding service.
 
         Args:
             model_name: Sentence Transformer model name (default: all-MiniLM-L6-v2, dimension=384)
+            backend: "onnx" (INT8 ONNX Runtime), "torch" (PyTorch, FP16/BF16 where
+                supported) or "auto" (torch on CUDA hosts, onnx otherwise)
+            cache_dir: Directory for the exported ONNX model (default: ~/.cache/endee)
+            max_batch_size: Maximum queries coalesced by embed_async
+            max_latency_ms: Maximum time embed_async waits for a batch to fill
         """
-        logger.info(f"Loading embedding model: {model_name}")
-        self.model = SentenceTransformer(model_name)
-        self.dimension = self.model.get_sentence_embedding_dimension()
+        if backend == "auto":
+            backend = "torch" if _cuda_available() else "onnx"
+
+        logger.info(f"Loading embedding model: {model_name} ({backend})")
+        self.model_name = model_name
+        self.backend = backend
+        self.cache_dir = Path(cache_dir or DEFAULT_CACHE_DIR).expanduser()
+        self.batch_size = ENCODE_BATCH_SIZE
+
+        if backend == "onnx":
+            self._load_onnx()
+        elif backend == "torch":
+            self._load_torch()
+        else:
+            raise ValueError(f"Unknown embedding backend: {backend}")
+
+        self._batcher = AsyncBatcher(
+            self.embed_queries,
+            max_batch_size=max_batch_size,
+            max_latency_ms=max_latency_ms,
+        )
         logger.info(f"Embedding dimension: {self.dimension}")
 
-    def embed(self, texts: List[str]) -> List[List[float]]:
+    def _load_torch(self):
+        """
+        Load the model as a PyTorch SentenceTransformer.
+
+        On CUDA the weights are cast to FP16 and encode runs under FP16
+        autocast; CPUs with AVX512-BF16 use BF16 instead, other CPUs FP32.
+        """
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.model = SentenceTransformer(self.model_name, device=self.device)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+        self.max_seq_length = self.model.max_seq_length
+        self._autocast_dtype = None
+
+        if self.device == "cuda":
+            self.model.half()
+            self._autocast_dtype = torch.float16
+            self.batch_size = CUDA_ENCODE_BATCH_SIZE
+        elif _cpu_supports_bf16():
+            self.model = self.model.to(torch.bfloat16)
+            self._autocast_dtype = torch.bfloat16
+        logger.info(f"Embedding model dtype: {next(self.model.parameters()).dtype}")
+
+    def _load_onnx(self):
+        """Load (exporting and quantizing on first use) the ONNX model."""
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        model_dir = self._export_onnx()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(model_dir / QUANTIZED_MODEL_FILE),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.dimension = AutoConfig.from_pretrained(model_dir).hidden_size
+        # Truncate where the SentenceTransformer does, so both backends agree
+        self.max_seq_length = self._read_max_seq_length(model_dir)
+        # Per-instance cache, so recurring queries skip the tokenizer; bulk
+        # document encodes bypass it (see embed_queries)
+        self._tokenize_cached = functools.lru_cache(maxsize=TOKENIZER_CACHE_SIZE)(
+            self._tokenize
+        )
+
+    def _tokenize(self, text: str) -> Dict[str, np.ndarray]:
+        """Tokenize one text without padding (cached by _tokenize_cached)."""
+        encoding = self.tokenizer(
+            text,
+            padding=False,
+            truncation=True,
+            max_length=self.max_seq_length,
+            return_tensors="np",
+        )
+        tokens = {}
+        for name, value in encoding.items():
+            value = value[0].astype(np.int64)
+            value.setflags(write=False)
+            tokens[name] = value
+        return tokens
+
+    @staticmethod
+    def _read_max_seq_length(model_dir: Path) -> int:
+        """Return the max_seq_length saved next to the export (or the default)."""
+        try:
+            config = json.loads((model_dir / SBERT_CONFIG_FILE).read_text())
+            return int(config["max_seq_length"])
+        except (OSError, KeyError, TypeError, ValueError):
+            return DEFAULT_MAX_SEQ_LENGTH
+
+    def _export_onnx(self) -> Path:
+        """
+        Export the model to ONNX and apply dynamic INT8 quantization.
+
+        The result is cached on disk, so the export only runs once per model.
+
+        Returns:
+            Directory containing the quantized model and tokenizer
+        """
+        hub_id = (
+            self.model_name
+            if "/" in self.model_name
+            else f"sentence-transformers/{self.model_name}"
+        )
+        model_dir = self.cache_dir / hub_id.replace("/", "--")
+        if (model_dir / QUANTIZED_MODEL_FILE).exists():
+            return model_dir
+
+        from huggingface_hub import hf_hub_download
+        from huggingface_hub.utils import EntryNotFoundError
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+
+        logger.info(f"Exporting {hub_id} to ONNX (INT8) under {model_dir}")
+        ort_model = ORTModelForFeatureExtraction.from_pretrained(hub_id, export=True)
+        ort_model.save_pretrained(model_dir)
+        AutoTokenizer.from_pretrained(hub_id).save_pretrained(model_dir)
+        try:
+            shutil.copy(
+                hf_hub_download(hub_id, SBERT_CONFIG_FILE), model_dir / SBERT_CONFIG_FILE
+            )
+        except EntryNotFoundError:
+            logger.warning(
+                f"{hub_id} has no {SBERT_CONFIG_FILE}; "
+                f"truncating at {DEFAULT_MAX_SEQ_LENGTH} tokens"
+            )
+
+        quantizer = ORTQuantizer.from_pretrained(ort_model)
+        quantizer.quantize(
+            save_dir=model_dir,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(
+                is_static=False, per_channel=False
+            ),
+        )
+        return model_dir
+
+    def _encode(self, texts: List[str], cache_tokens: bool = False) -> np.ndarray:
+        """Encode texts with the configured backend."""
+        if self.backend == "onnx":
+            return self._encode_onnx(texts, cache_tokens)
+        return self._encode_torch(texts)
+
+    def _encode_torch(self, texts: List[str]) -> np.ndarray:
+        """Run the SentenceTransformer, under FP16/BF16 autocast when enabled."""
+        import torch
+
+        with torch.inference_mode(), torch.autocast(
+            device_type=self.device,
+            dtype=self._autocast_dtype or torch.bfloat16,
+            enabled=self._autocast_dtype is not None,
+        ):
+            embeddings = self.model.encode(
+                texts,
+                batch_size=self.batch_size,
+                convert_to_tensor=True,
+                device=self.device,
+            )
+        # Upcast before .numpy(): NumPy has no bfloat16, and older
+        # sentence-transformers releases convert without upcasting
+        return embeddings.float().cpu().numpy()
+
+    def _encode_onnx(self, texts: List[str], cache_tokens: bool = False) -> np.ndarray:
+        """
+        Run the ONNX model and mean-pool token embeddings.
+
+        Args:
+            texts: List of text strings
+            cache_tokens: Tokenize through the per-text LRU cache instead of
+                one batched tokenizer call
+
+        Returns:
+            Mean-pooled embeddings, shape (len(texts), dimension)
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
+        if cache_tokens:
+            # Pad the cached per-text encodings into one batch
+            encodings = [self._tokenize_cached(text) for text in texts]
+            max_length = max(len(e["input_ids"]) for e in encodings)
+            inputs = {
+                name: np.zeros((len(texts), max_length), dtype=np.int64)
+                for name in encodings[0]
+            }
+            inputs["input_ids"].fill(self.tokenizer.pad_token_id or 0)
+            for i, encoding in enumerate(encodings):
+                for name, value in encoding.items():
+                    inputs[name][i, : len(value)] = value
+        else:
+            encoding = self.tokenizer(
+                texts,
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            inputs = {name: value.astype(np.int64) for name, value in encoding.items()}
+
+        feed = {
+            name: value for name, value in inputs.items() if name in self._input_names
+        }
+        token_embeddings = self.session.run(None, feed)[0]
+
+        mask = inputs["attention_mask"][..., np.newaxis].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        return summed / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def embed(self, texts: List[str], cache_tokens: bool = False) -> np.ndarray:
         """
         Generate embeddings for texts.
 
+        Every row is L2-normalized, so cosine similarity between embeddings
+        is a plain dot product and every component lies in [-1, 1].
+
         Args:
             texts: List of text strings
+            cache_tokens: Reuse cached tokenizer output for repeated texts
+                (ONNX backend; meant for short recurring queries)
 
         Returns:
-            List of embedding vectors
+            Float32 array of shape (len(texts), dimension)
         """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+
         try:
-            embeddings = self.model.encode(texts, convert_to_tensor=False)
+            # Encode length-sorted sub-batches so each one pads only to its own
+            # longest text, then restore the caller's order.
+            order = np.argsort([len(t.split()) for t in texts], kind="stable")
+            sorted_texts = [texts[i] for i in order]
+            batches = [
+                self._encode(sorted_texts[i : i + self.batch_size], cache_tokens)
+                for i in range(0, len(sorted_texts), self.batch_size)
+            ]
+            inverse = np.empty_like(order)
+            inverse[order] = np.arange(len(order))
+            embeddings = np.concatenate(batches)[inverse]
+            embeddings /= np.clip(
+                np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None
+            )
             logger.info(f"Generated embeddings for {len(texts)} texts")
-            return embeddings.tolist()
+            return embeddings
         except Exception as e:
             logger.error(f"Failed to generate embeddings: {e}")
             raise
 
-    def embed_single(self, text: str) -> List[float]:
+    def embed_queries(self, texts: List[str]) -> np.ndarray:
+        """
+        Generate embeddings for query texts, reusing cached tokenizer output.
+
+        Args:
+            texts: List of query strings
+
+        Returns:
+            Float32 array of shape (len(texts), dimension)
+        """
+        return self.embed(texts, cache_tokens=True)
+
+    def embed_single(self, text: str) -> np.ndarray:
         """
         Generate embedding for a single text.
 
@@ -51,6 +343,40 @@ class EmbeddingService:
             text: Text string
 
         Returns:
-            Embedding vector
+            1-D embedding vector
         """
         return self.embed([text])[0]
+
+    @staticmethod
+    def quantize_int8(vectors: np.ndarray) -> np.ndarray:
+        """
+        Scalar-quantize normalized vectors to INT8 with a fixed scale.
+
+        Components of unit vectors lie in [-1, 1], so a shared scale of
+        INT8_SCALE (1/127) is used instead of per-vector ranges; a component
+        is recovered as ``q * INT8_SCALE``.
+
+        Args:
+            vectors: L2-normalized array of shape (N, dimension)
+
+        Returns:
+            INT8 codes of the same shape
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return np.clip(np.round(vectors / INT8_SCALE), -127, 127).astype(np.int8)
+
+    async def embed_async(self, text: str) -> np.ndarray:
+        """
+        Generate embedding for a single text, batched with concurrent callers.
+
+        Args:
+            text: Text string
+
+        Returns:
+            1-D embedding vector
+        """
+        return await self._batcher.submit(text)
+
+    async def close(self):
+        """Stop the background batching task."""
+        await self._batcher.close()
@@ -3,9 +3,14 @@ Endee vector database client.
 Handles connection, index management, and vector operations.
 """
 
-import requests
+import asyncio
+import httpx
+import itertools
+import orjson
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Optional, Union
+
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -22,9 +27,35 @@ class EndeeClient:
             port: Endee server port
         """
         self.base_url = f"http://{host}:{port}"
-        self.session = requests.Session()
+        self.client: Optional[httpx.AsyncClient] = None
+
+    async def connect(self):
+        """Open the pooled HTTP/2 connection to Endee."""
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=100, max_keepalive_connections=50
+                ),
+                timeout=10.0,
+            )
 
-    def create_index(self, index_name: str, dimension: int = 384) -> Dict[str, Any]:
+    async def close(self):
+        """Close the HTTP connection pool."""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        """POST a JSON payload encoded with orjson (numpy arrays included)."""
+        return await self.client.post(
+            path,
+            content=orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY),
+            headers={"Content-Type": "application/json"},
+        )
+
+    async def create_index(self, index_name: str, dimension: int = 384) -> Dict[str, Any]:
         """
         Create a new index.
 
@@ -36,18 +67,18 @@ class EndeeClient:
             Response from Endee
         """
         try:
-            response = self.session.post(
-                f"{self.base_url}/api/v1/index/create",
-                json={"name": index_name, "dimension": dimension},
+            response = await self._post(
+                "/api/v1/index/create",
+                {"name": index_name, "dimension": dimension},
             )
             response.raise_for_status()
             logger.info(f"Created index: {index_name}")
-            return response.json()
-        except requests.RequestException as e:
+            return orjson.loads(response.content)
+        except httpx.HTTPError as e:
             logger.error(f"Failed to create index {index_name}: {e}")
             raise
 
-    def list_indices(self) -> List[str]:
+    async def list_indices(self) -> List[str]:
         """
         List all indices.
 
@@ -55,14 +86,14 @@ class EndeeClient:
             List of index names
         """
         try:
-            response = self.session.get(f"{self.base_url}/api/v1/index/list")
+            response = await self.client.get("/api/v1/index/list")
             response.raise_for_status()
-            return response.json().get("indices", [])
-        except requests.RequestException as e:
+            return orjson.loads(response.content).get("indices", [])
+        except httpx.HTTPError as e:
             logger.error(f"Failed to list indices: {e}")
             raise
 
-    def insert_vectors(
+    async def insert_vectors(
         self, index_name: str, vectors: List[Dict[str, Any]]
     ) -> Dict[str, Any]:
         """
@@ -70,7 +101,7 @@ class EndeeClient:
 
         Args:
             index_name: Name of the index
-            vectors: List of vectors with id, vector, and optional metadata
+            vectors: List of vectors with id, vector (or vector_q8), and optional metadata
 
         Returns:
             Response from Endee
@@ -80,21 +111,62 @@ class EndeeClient:
                 "index_name": index_name,
                 "vectors": vectors,
             }
-            response = self.session.post(
-                f"{self.base_url}/api/v1/upsert",
-                json=payload,
-            )
+            response = await self._post("/api/v1/upsert", payload)
             response.raise_for_status()
             logger.info(f"Inserted {len(vectors)} vectors into {index_name}")
-            return response.json()
-        except requests.RequestException as e:
+            return orjson.loads(response.content)
+        except httpx.HTTPError as e:
             logger.error(f"Failed to insert vectors: {e}")
             raise
 
-    def search(
+    async def insert_vectors_batched(
         self,
         index_name: str,
-        query_vector: List[float],
+        vectors: Iterable[Dict[str, Any]],
+        chunk_size: int = 500,
+        max_concurrency: int = 4,
+    ) -> int:
+        """
+        Insert vectors in fixed-size chunks with several requests in flight.
+
+        Args:
+            index_name: Name of the index
+            vectors: Iterable of vectors (consumed lazily, one chunk at a time)
+            chunk_size: Maximum vectors per upsert request
+            max_concurrency: Maximum concurrent upsert requests
+
+        Returns:
+            Number of vectors inserted
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def insert(chunk: List[Dict[str, Any]]):
+            try:
+                await self.insert_vectors(index_name, chunk)
+            finally:
+                semaphore.release()
+
+        # Only build the next chunk once a request slot is free, so at most
+        # max_concurrency chunks are held in memory at a time.
+        tasks = []
+        total = 0
+        iterator = iter(vectors)
+        while True:
+            await semaphore.acquire()
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                semaphore.release()
+                break
+            total += len(chunk)
+            tasks.append(asyncio.create_task(insert(chunk)))
+
+        await asyncio.gather(*tasks)
+        return total
+
+    async def search(
+        self,
+        index_name: str,
+        query_vector: Union[List[float], np.ndarray],
         top_k: int = 5,
     ) -> List[Dict[str, Any]]:
         """
@@ -102,7 +174,7 @@ class EndeeClient:
 
         Args:
             index_name: Name of the index
-            query_vector: Query vector embedding
+            query_vector: Query vector embedding (L2-normalized)
             top_k: Number of top results to return
 
         Returns:
@@ -114,19 +186,16 @@ class EndeeClient:
                 "vector": query_vector,
                 "k": top_k,
             }
-            response = self.session.post(
-                f"{self.base_url}/api/v1/search",
-                json=payload,
-            )
+            response = await self._post("/api/v1/search", payload)
             response.raise_for_status()
-            results = response.json().get("results", [])
+            results = orjson.loads(response.content).get("results", [])
             logger.info(f"Search completed for {index_name}, found {len(results)} results")
             return results
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Search failed: {e}")
             raise
 
-    def delete_index(self, index_name: str) -> Dict[str, Any]:
+    async def delete_index(self, index_name: str) -> Dict[str, Any]:
         """
         Delete an index.
 
@@ -137,13 +206,12 @@ class EndeeClient:
             Response from Endee
         """
         try:
-            response = self.session.post(
-                f"{self.base_url}/api/v1/index/delete",
-                json={"name": index_name},
+            response = await self._post(
+                "/api/v1/index/delete", {"name": index_name}
             )
             response.raise_for_status()
             logger.info(f"Deleted index: {index_name}")
-            return response.json()
-        except requests.RequestException as e:
+            return orjson.loads(response.content)
+        except httpx.HTTPError as e:
             logger.error(f"Failed to delete index {index_name}: {e}")
             raise
@@ -3,17 +3,40 @@ FastAPI server for Endee RAG + Semantic Search application.
 Provides endpoints for document indexing, semantic search, and RAG retrieval.
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import (
+    BackgroundTasks,
+    FastAPI,
+    File,
+    HTTPException,
+    Request,
+    UploadFile,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List
+from fastapi.responses import Response
+from starlette.datastructures import State
+from typing import Iterator, List
+import asyncio
+import base64
+import codecs
+import numpy as np
+import orjson
 import os
 from dotenv import load_dotenv
 import logging
 
 from endee_client import EndeeClient
 from embeddings import EmbeddingService
+from models import (
+    DocumentChunk,
+    RAGBatchResponse,
+    RAGQuery,
+    RAGResponse,
+    SearchQuery,
+    SemanticSearchResponse,
+)
 from rag_engine import RAGEngine
+from semantic_cache import LSHCache
 
 # Load environment variables
 load_dotenv()
@@ -22,8 +45,56 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build shared services once per worker and release them on shutdown.
+
+    Services live on app.state; handlers reach them through request.app.state.
+    """
+    endee_client = EndeeClient(
+        host=os.getenv("ENDEE_HOST", "localhost"),
+        port=int(os.getenv("ENDEE_PORT", 8080)),
+    )
+    await endee_client.connect()
+
+    embedding_service = EmbeddingService(
+        model_name=os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2"),
+        backend=os.getenv("EMBEDDING_BACKEND", "auto"),
+        cache_dir=os.getenv("ENDEE_CACHE_DIR"),
+    )
+    semantic_cache = LSHCache(
+        dimension=embedding_service.dimension,
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95)),
+        ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL", 300)),
+    )
+    # Warm up so one-time kernel/graph initialization doesn't hit the first request
+    embedding_service.embed(["warmup"] * 2)
+    semantic_cache.warmup()
+
+    app.state.endee_client = endee_client
+    app.state.embedding_service = embedding_service
+    app.state.semantic_cache = semantic_cache
+    app.state.rag_engine = RAGEngine(
+        embedding_service=embedding_service,
+        endee_client=endee_client,
+        llm_api_key=os.getenv("LLM_API_KEY"),
+        llm_model=os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
+        context_token_budget=int(os.getenv("LLM_CONTEXT_TOKENS", 2048)),
+        semantic_cache=semantic_cache,
+    )
+    yield
+    await embedding_service.close()
+    await endee_client.close()
+
+
 # Initialize FastAPI app
-app = FastAPI(title="Endee RAG & Semantic Search API", version="1.0.0")
+app = FastAPI(
+    title="Endee RAG & Semantic Search API",
+    version="1.0.0",
+    lifespan=lifespan,
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -34,47 +105,38 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-endee_client = EndeeClient(
-    host=os.getenv("ENDEE_HOST", "localhost"),
-    port=int(os.getenv("ENDEE_PORT", 8080)),
-)
-embedding_service = EmbeddingService()
-rag_engine = RAGEngine(
-    embedding_service=embedding_service,
-    endee_client=endee_client,
-    llm_api_key=os.getenv("LLM_API_KEY"),
-    llm_model=os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
-)
-
-
-# Request/Response models
-class DocumentChunk(BaseModel):
-    id: str
-    content: str
-    metadata: dict = {}
-
-
-class SearchQuery(BaseModel):
-    query: str
-    top_k: int = 5
+# Send INT8-quantized vectors (vector_q8, fixed scale 1/127) instead of FP32
+# lists. Requires an Endee deployment that accepts the quantized upsert format.
+quantize_vectors = os.getenv("ENDEE_QUANTIZE_VECTORS", "false").lower() == "true"
 
 
-class RAGQuery(BaseModel):
-    question: str
-    top_k: int = 5
-
-
-class SearchResult(BaseModel):
-    id: str
-    content: str
-    similarity: float
-    metadata: dict
+def _iter_vectors(
+    documents: List[DocumentChunk], embeddings: np.ndarray
+) -> Iterator[dict]:
+    """Yield Endee upsert records for documents and their embeddings."""
+    if quantize_vectors:
+        codes = EmbeddingService.quantize_int8(embeddings)
+        encoded = (
+            {"vector_q8": base64.b64encode(code.tobytes()).decode()}
+            for code in codes
+        )
+    else:
+        encoded = ({"vector": embedding} for embedding in embeddings)
+
+    for doc, vector in zip(documents, encoded):
+        yield {
+            "id": doc.id,
+            **vector,
+            "metadata": {
+                "content": doc.content,
+                **doc.metadata,
+            },
+        }
 
 
-class RAGResponse(BaseModel):
-    answer: str
-    sources: List[SearchResult]
+def _json_response(content) -> Response:
+    """Serialize `content` with orjson into a JSON response."""
+    return Response(orjson.dumps(content), media_type="application/json")
 
 
 # Health check
@@ -86,10 +148,10 @@ async def health():
 
 # Index management
 @app.post("/api/v1/index/create")
-async def create_index(index_name: str, dimension: int = 384):
+async def create_index(request: Request, index_name: str, dimension: int = 384):
     """Create a new index in Endee."""
     try:
-        result = endee_client.create_index(index_name, dimension)
+        result = await request.app.state.endee_client.create_index(index_name, dimension)
         logger.info(f"Created index: {index_name}")
         return {"index": index_name, "dimension": dimension, "status": "created"}
     except Exception as e:
@@ -98,10 +160,10 @@ async def create_index(index_name: str, dimension: int = 384):
 
 
 @app.get("/api/v1/index/list")
-async def list_indices():
+async def list_indices(request: Request):
     """List all indices in Endee."""
     try:
-        indices = endee_client.list_indices()
+        indices = await request.app.state.endee_client.list_indices()
         return {"indices": indices}
     except Exception as e:
         logger.error(f"Failed to list indices: {e}")
@@ -111,29 +173,25 @@ async def list_indices():
 # Document indexing
 @app.post("/api/v1/documents/index")
 async def index_documents(
+    request: Request,
     index_name: str,
     documents: List[DocumentChunk],
 ):
     """Index documents with embeddings in Endee."""
+    state = request.app.state
     try:
-        # Generate embeddings for documents
+        # Generate embeddings for documents off the event loop
         texts = [doc.content for doc in documents]
-        embeddings = embedding_service.embed(texts)
+        loop = asyncio.get_running_loop()
+        embeddings = await loop.run_in_executor(
+            None, state.embedding_service.embed, texts
+        )
 
         # Index in Endee
-        vectors = [
-            {
-                "id": doc.id,
-                "vector": embeddings[i],
-                "metadata": {
-                    "content": doc.content,
-                    **doc.metadata,
-                },
-            }
-            for i, doc in enumerate(documents)
-        ]
+        vectors = _iter_vectors(documents, embeddings)
 
-        endee_client.insert_vectors(index_name, vectors)
+        await state.endee_client.insert_vectors_batched(index_name, vectors)
+        state.semantic_cache.clear()
         logger.info(f"Indexed {len(documents)} documents in {index_name}")
         return {
             "indexed": len(documents),
@@ -146,88 +204,192 @@ async def index_documents(
 
 
 # Semantic search
-@app.post("/api/v1/search/semantic")
-async def semantic_search(index_name: str, query: SearchQuery) -> dict:
+# Results are returned as plain dicts as orjson-encoded Responses, skipping
+# response-model validation; the models are kept for the OpenAPI schema.
+@app.post(
+    "/api/v1/search/semantic", responses={200: {"model": SemanticSearchResponse}}
+)
+async def semantic_search(
+    request: Request, index_name: str, query: SearchQuery
+) -> Response:
     """Perform semantic search using embeddings."""
+    state = request.app.state
     try:
-        # Embed query
-        query_embedding = embedding_service.embed([query.query])[0]
-
-        # Search in Endee
-        results = endee_client.search(
-            index_name, query_embedding, top_k=query.top_k
+        results = await state.rag_engine.retrieve(
+            index_name, query.query, query.top_k
         )
 
-        # Format results
-        formatted_results = [
-            SearchResult(
-                id=r["id"],
-                content=r["metadata"].get("content", ""),
-                similarity=r.get("score", 0),
-                metadata=r.get("metadata", {}),
-            )
-            for r in results
-        ]
-
         logger.info(f"Semantic search completed for query: {query.query}")
-        return {
-            "query": query.query,
-            "results": [r.dict() for r in formatted_results],
-        }
+        return _json_response({"query": query.query, "results": results})
     except Exception as e:
         logger.error(f"Semantic search failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # RAG retrieval
-@app.post("/api/v1/rag/query")
-async def rag_query(index_name: str, query: RAGQuery) -> dict:
+@app.post("/api/v1/rag/query", responses={200: {"model": RAGResponse}})
+async def rag_query(
+    request: Request, index_name: str, query: RAGQuery
+) -> Response:
     """Perform RAG query: retrieve context + generate answer."""
+    state = request.app.state
     try:
         # Retrieve context using semantic search
-        query_embedding = embedding_service.embed([query.question])[0]
-        search_results = endee_client.search(
-            index_name, query_embedding, top_k=query.top_k
+        sources = await state.rag_engine.retrieve(
+            index_name, query.question, query.top_k
         )
 
-        # Extract sources
-        sources = [
-            SearchResult(
-                id=r["id"],
-                content=r["metadata"].get("content", ""),
-                similarity=r.get("score", 0),
-                metadata=r.get("metadata", {}),
-            )
-            for r in search_results
-        ]
-
         # Generate answer using RAG
-        answer = await rag_engine.generate_answer(query.question, sources)
+        answer = await state.rag_engine.generate_answer(query.question, sources)
 
         logger.info(f"RAG query completed for question: {query.question}")
-        return {
-            "question": query.question,
-            "answer": answer,
-            "sources": [s.dict() for s in sources],
-        }
+        return _json_response(
+            {"question": query.question, "answer": answer, "sources": sources}
+        )
     except Exception as e:
         logger.error(f"RAG query failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+MAX_BATCH_QUERIES = 32
+
+
+@app.post("/api/v1/rag/batch_query", responses={200: {"model": RAGBatchResponse}})
+async def rag_batch_query(
+    request: Request, index_name: str, queries: List[RAGQuery]
+) -> Response:
+    """Perform several RAG queries, embedding all questions in one pass."""
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_BATCH_QUERIES} queries per batch",
+        )
+
+    state = request.app.state
+    try:
+        # Embed all questions in one encode pass, then search concurrently
+        loop = asyncio.get_running_loop()
+        questions = [q.question for q in queries]
+        embeddings = await loop.run_in_executor(
+            None, state.embedding_service.embed_queries, questions
+        )
+        sources = await asyncio.gather(
+            *[
+                state.rag_engine.retrieve_by_vector(index_name, embedding, q.top_k)
+                for q, embedding in zip(queries, embeddings)
+            ]
+        )
+
+        answers = await asyncio.gather(
+            *[
+                state.rag_engine.generate_answer(q.question, s)
+                for q, s in zip(queries, sources)
+            ]
+        )
+
+        logger.info(f"RAG batch query completed for {len(queries)} questions")
+        return _json_response(
+            {
+                "results": [
+                    {"question": q.question, "answer": answer, "sources": s}
+                    for q, answer, s in zip(queries, answers, sources)
+                ]
+            }
+        )
+    except Exception as e:
+        logger.error(f"RAG batch query failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # Document upload (simplified)
+MAX_UPLOAD_CHUNKS = 10  # Limit to 10 chunks for demo
+UPLOAD_READ_SIZE = 64 * 1024
+
+
+def _split_paragraphs(
+    text: str, chunks: List[str], limit: int, search_from: int = 0
+) -> int:
+    """
+    Append non-empty paragraphs of `text` to `chunks` until `limit` is reached.
+
+    Uses a bounded str.find loop instead of str.split, so nothing past the
+    last needed boundary is scanned or copied.
+
+    Args:
+        text: Text to split on blank lines
+        chunks: List the paragraphs are appended to
+        limit: Maximum length of `chunks`
+        search_from: Offset before which `text` is known to hold no boundary
+
+    Returns:
+        Offset of the first character not consumed into a paragraph
+    """
+    start = 0
+    while len(chunks) < limit:
+        end = text.find("\n\n", max(start, search_from))
+        if end < 0:
+            break
+        piece = text[start:end]
+        if piece.strip():
+            chunks.append(piece)
+        start = end + 2
+    return start
+
+
+async def _read_chunks(file: UploadFile, limit: int = MAX_UPLOAD_CHUNKS) -> List[str]:
+    """
+    Stream-decode an upload and return its first non-empty paragraphs.
+
+    Reading stops as soon as `limit` chunks have been found, so only the
+    beginning of a large file is ever held in memory.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    chunks: List[str] = []
+    buffer = ""
+    search_from = 0
+    while len(chunks) < limit:
+        data = await file.read(UPLOAD_READ_SIZE)
+        buffer += decoder.decode(data, final=not data)
+
+        buffer = buffer[_split_paragraphs(buffer, chunks, limit, search_from) :]
+        # The rest holds no boundary, except possibly one straddling the next read
+        search_from = max(len(buffer) - 1, 0)
+
+        if not data:
+            if len(chunks) < limit and buffer.strip():
+                chunks.append(buffer)
+            break
+    return chunks
+
+
+async def _index_chunks(
+    state: State, index_name: str, documents: List[DocumentChunk]
+):
+    """Embed and upsert uploaded chunks (runs after the response is sent)."""
+    try:
+        loop = asyncio.get_running_loop()
+        embeddings = await loop.run_in_executor(
+            None, state.embedding_service.embed, [doc.content for doc in documents]
+        )
+        vectors = _iter_vectors(documents, embeddings)
+
+        await state.endee_client.insert_vectors_batched(index_name, vectors)
+        state.semantic_cache.clear()
+        logger.info(f"Indexed {len(documents)} uploaded chunks in {index_name}")
+    except Exception as e:
+        logger.error(f"Background indexing failed for {index_name}: {e}")
+
+
 @app.post("/api/v1/documents/upload")
 async def upload_document(
+    request: Request,
     index_name: str,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
 ):
-    """Upload and index a document."""
+    """Upload a document; its chunks are embedded and indexed in the background."""
     try:
-        content = await file.read()
-        text = content.decode("utf-8")
-
-        # Split into chunks (simple implementation)
-        chunks = text.split("\n\n")[:10]  # Limit to 10 chunks for demo
+        chunks = await _read_chunks(file)
 
         documents = [
             DocumentChunk(
@@ -236,29 +398,17 @@ async def upload_document(
                 metadata={"source": file.filename, "chunk_index": i},
             )
             for i, chunk in enumerate(chunks)
-            if chunk.strip()
         ]
 
         # Index documents
-        embeddings = embedding_service.embed([doc.content for doc in documents])
-        vectors = [
-            {
-                "id": doc.id,
-                "vector": embeddings[i],
-                "metadata": {
-                    "content": doc.content,
-                    **doc.metadata,
-                },
-            }
-            for i, doc in enumerate(documents)
-        ]
-
-        endee_client.insert_vectors(index_name, vectors)
-        logger.info(f"Uploaded and indexed {file.filename}")
+        background_tasks.add_task(
+            _index_chunks, request.app.state, index_name, documents
+        )
+        logger.info(f"Uploaded {file.filename}, indexing {len(documents)} chunks")
         return {
             "filename": file.filename,
             "chunks_indexed": len(documents),
-            "status": "success",
+            "status": "accepted",
         }
     except Exception as e:
         logger.error(f"Document upload failed: {e}")
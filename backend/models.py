@@ -0,0 +1,44 @@
+"""
+Request and response models for the API.
+"""
+
+from pydantic import BaseModel
+from typing import List
+
+
+class DocumentChunk(BaseModel):
+    id: str
+    content: str
+    metadata: dict = {}
+
+
+class SearchQuery(BaseModel):
+    query: str
+    top_k: int = 5
+
+
+class RAGQuery(BaseModel):
+    question: str
+    top_k: int = 5
+
+
+class SearchResult(BaseModel):
+    id: str
+    content: str
+    similarity: float
+    metadata: dict
+
+
+class SemanticSearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+
+
+class RAGResponse(BaseModel):
+    question: str
+    answer: str
+    sources: List[SearchResult]
+
+
+class RAGBatchResponse(BaseModel):
+    results: List[RAGResponse]
@@ -3,23 +3,39 @@ RAG (Retrieval Augmented Generation) engine.
 Combines semantic search with LLM for answer generation.
 """
 
+import io
 import logging
-from typing import List
+from typing import List, Optional
+
+import numpy as np
+
 from embeddings import EmbeddingService
 from endee_client import EndeeClient
+from semantic_cache import LSHCache
 
 logger = logging.getLogger(__name__)
 
+CHARS_PER_TOKEN = 4  # Rough average for English text
+
 
 class RAGEngine:
     """RAG engine for question answering with context."""
 
+    _PROMPT = (
+        "Based on the following context, answer the question.\n\n"
+        "Context:\n{context}\n\n"
+        "Question:\n{question}\n\n"
+        "Answer:"
+    )
+
     def __init__(
         self,
         embedding_service: EmbeddingService,
         endee_client: EndeeClient,
         llm_api_key: str = None,
         llm_model: str = "gpt-3.5-turbo",
+        context_token_budget: int = 2048,
+        semantic_cache: Optional[LSHCache] = None,
     ):
         """
         Initialize RAG engine.
@@ -29,27 +45,89 @@ class RAGEngine:
             endee_client: Endee client for vector search
             llm_api_key: API key for LLM (OpenAI, etc.)
             llm_model: LLM model name
+            context_token_budget: Approximate token budget shared by all sources
+            semantic_cache: Optional cache for search results of similar queries
         """
         self.embedding_service = embedding_service
         self.endee_client = endee_client
+        self.semantic_cache = semantic_cache
         self.llm_api_key = llm_api_key
         self.llm_model = llm_model
+        self.context_token_budget = context_token_budget
         logger.info(f"Initialized RAG engine with model: {llm_model}")
 
+    async def retrieve(
+        self, index_name: str, text: str, top_k: int = 5
+    ) -> List[dict]:
+        """
+        Retrieve the sources most similar to a text.
+
+        Shared by semantic search and RAG, so single queries go through the
+        same embedding batcher and semantic cache.
+
+        Args:
+            index_name: Name of the index to search
+            text: Query text
+            top_k: Number of results to return
+
+        Returns:
+            List of search results as plain dicts (SearchResult shape)
+        """
+        embedding = await self.embedding_service.embed_async(text)
+        return await self.retrieve_by_vector(index_name, embedding, top_k)
+
+    async def retrieve_by_vector(
+        self, index_name: str, embedding: np.ndarray, top_k: int = 5
+    ) -> List[dict]:
+        """
+        Retrieve the sources most similar to a precomputed query embedding.
+
+        Used by the batch route, which embeds all of its questions at once.
+
+        Args:
+            index_name: Name of the index to search
+            embedding: Query embedding
+            top_k: Number of results to return
+
+        Returns:
+            List of search results as plain dicts (SearchResult shape)
+        """
+        cache = self.semantic_cache
+        scope = (index_name, top_k)
+        results = cache.get(embedding, scope) if cache is not None else None
+        if results is None:
+            results = await self.endee_client.search(index_name, embedding, top_k=top_k)
+            if cache is not None:
+                cache.put(embedding, results, scope)
+
+        return [
+            {
+                "id": r["id"],
+                "content": r["metadata"].get("content", ""),
+                "similarity": r.get("score", 0.0),
+                "metadata": r.get("metadata", {}),
+            }
+            for r in results
+        ]
+
     async def generate_answer(self, question: str, sources: List) -> str:
         """
         Generate an answer using retrieved context.
 
         Args:
             question: User's question
-            sources: List of retrieved source documents
+            sources: List of retrieved source documents (models or dicts)
 
         Returns:
             Generated answer
         """
         try:
             # Build context from sources
-            context = self._build_context(sources)
+            contents = [
+                s.get("content", "") if isinstance(s, dict) else s.content
+                for s in sources
+            ]
+            context = self._build_context(contents)
 
             # Generate answer (simplified - uses context injection)
             # In production, integrate with OpenAI API or local LLM
@@ -61,26 +139,31 @@ class RAGEngine:
             logger.error(f"Failed to generate answer: {e}")
             raise
 
-    def _build_context(self, sources: List) -> str:
+    def _build_context(self, contents: List[str]) -> str:
         """
-        Build context string from sources.
+        Build context string from source contents.
+
+        Each source is truncated to an equal share of the token budget.
 
         Args:
-            sources: List of source documents
+            contents: Content of each source document
 
         Returns:
             Formatted context string
         """
-        context_parts = []
-        for i, source in enumerate(sources, 1):
-            content = (
-                source.content
-                if hasattr(source, "content")
-                else source.get("content", "")
-            )
-            context_parts.append(f"Source {i}:\n{content}")
-
-        return "\n\n".join(context_parts)
+        if not contents:
+            return ""
+
+        limit = self.context_token_budget * CHARS_PER_TOKEN // len(contents)
+        buffer = io.StringIO()
+        for i, content in enumerate(contents, 1):
+            if i > 1:
+                buffer.write("\n\n")
+            buffer.write("Source ")
+            buffer.write(str(i))
+            buffer.write(":\n")
+            buffer.write(content[:limit])
+        return buffer.getvalue()
 
     async def _generate_with_llm(self, question: str, context: str) -> str:
         """
@@ -100,15 +183,7 @@ class RAGEngine:
         # - Hugging Face Transformers
         # - Claude API, etc.
 
-        prompt = f"""Based on the following context, answer the question.
-
-Context:
-{context}
-
-Question:
-{question}
-
-Answer:"""
+        prompt = self._PROMPT.format_map({"context": context, "question": question})
 
         # For demo, return a template response
         # Replace with actual LLM call
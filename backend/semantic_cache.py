@@ -0,0 +1,189 @@
+"""
+Semantic cache for vector search results.
+Looks up previous results by query embedding using random-projection LSH.
+The hashing and rerank loops are compiled with numba.
+"""
+
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, NamedTuple, Optional
+
+import numpy as np
+from numba import njit
+
+logger = logging.getLogger(__name__)
+
+
+@njit(cache=True, fastmath=True)
+def _lsh_hash(query: np.ndarray, projections: np.ndarray) -> np.ndarray:
+    """Sign-bit hash of `query` against (n_tables, n_bits, dim) projections."""
+    n_tables, n_bits, dim = projections.shape
+    keys = np.empty(n_tables, dtype=np.uint16)
+    for t in range(n_tables):
+        key = 0
+        for b in range(n_bits):
+            acc = 0.0
+            for d in range(dim):
+                acc += query[d] * projections[t, b, d]
+            if acc > 0:
+                key |= 1 << b
+        keys[t] = key
+    return keys
+
+
+@njit(cache=True, fastmath=True)
+def _cosine_rerank(
+    query: np.ndarray, candidates: np.ndarray, threshold: float
+) -> int:
+    """Index of the unit-norm candidate most similar to `query` (-1 if none >= threshold)."""
+    best, best_similarity = -1, threshold
+    for i in range(candidates.shape[0]):
+        similarity = 0.0
+        for d in range(candidates.shape[1]):
+            similarity += query[d] * candidates[i, d]
+        if similarity >= best_similarity:
+            best, best_similarity = i, similarity
+    return best
+
+
+class _CacheEntry(NamedTuple):
+    vector: np.ndarray
+    payload: Any
+    scope: Hashable
+    keys: np.ndarray
+    expires_at: float
+
+
+class LSHCache:
+    """Approximate cache keyed by embedding, matched on cosine similarity."""
+
+    def __init__(
+        self,
+        dimension: int = 384,
+        n_tables: int = 8,
+        n_bits: int = 16,
+        threshold: float = 0.95,
+        ttl_seconds: float = 300.0,
+        max_entries: int = 1024,
+        seed: int = 0,
+    ):
+        """
+        Initialize cache.
+
+        Args:
+            dimension: Dimension of the embeddings
+            n_tables: Number of hash tables
+            n_bits: Hash bits per table (at most 16)
+            threshold: Minimum cosine similarity for a hit
+            ttl_seconds: Time an entry stays valid
+            max_entries: Maximum number of cached entries
+            seed: Seed for the random projections
+        """
+        if not 0 < n_bits <= 16:
+            raise ValueError("n_bits must be between 1 and 16")
+
+        rng = np.random.default_rng(seed)
+        self._projections = rng.standard_normal(
+            (n_tables, n_bits, dimension)
+        ).astype(np.float32)
+        self._tables: List[dict] = [{} for _ in range(n_tables)]
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self._ids = itertools.count()
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    def get(self, vector, scope: Hashable = None) -> Optional[Any]:
+        """
+        Look up a cached payload for a similar vector.
+
+        Args:
+            vector: Query embedding
+            scope: Extra key the entry must match exactly (e.g. index and top_k)
+
+        Returns:
+            Cached payload, or None on a miss
+        """
+        self._expire()
+        query = self._normalize(vector)
+
+        candidates = set()
+        for table, key in zip(self._tables, self._hash(query)):
+            candidates.update(table.get(key, ()))
+
+        entries = [
+            entry
+            for entry in (self._entries[entry_id] for entry_id in candidates)
+            if entry.scope == scope
+        ]
+        if not entries:
+            return None
+
+        vectors = np.stack([entry.vector for entry in entries])
+        best = _cosine_rerank(query, vectors, self.threshold)
+        return entries[best].payload if best >= 0 else None
+
+    def put(self, vector, payload: Any, scope: Hashable = None):
+        """
+        Cache a payload for a vector.
+
+        Args:
+            vector: Query embedding
+            payload: Value to return on later hits
+            scope: Extra key the entry must match exactly (e.g. index and top_k)
+        """
+        self._expire()
+        while len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+        query = self._normalize(vector)
+        keys = self._hash(query)
+        entry_id = next(self._ids)
+        self._entries[entry_id] = _CacheEntry(
+            query, payload, scope, keys, time.monotonic() + self.ttl_seconds
+        )
+        for table, key in zip(self._tables, keys):
+            table.setdefault(key, []).append(entry_id)
+
+    def warmup(self):
+        """Compile (or load from the numba cache) the hashing kernels."""
+        query = np.zeros(self._projections.shape[2], dtype=np.float32)
+        _lsh_hash(query, self._projections)
+        _cosine_rerank(query, query[np.newaxis, :], self.threshold)
+
+    def clear(self):
+        """Drop all cached entries."""
+        self._entries.clear()
+        for table in self._tables:
+            table.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _hash(self, vector: np.ndarray) -> np.ndarray:
+        """Return one uint16 bucket key per table."""
+        return _lsh_hash(vector, self._projections)
+
+    def _expire(self):
+        """Remove entries whose TTL has passed (oldest first)."""
+        now = time.monotonic()
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now:
+                break
+            self._remove(entry_id)
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for table, key in zip(self._tables, entry.keys):
+            bucket = table[key]
+            bucket.remove(entry_id)
+            if not bucket:
+                del table[key]